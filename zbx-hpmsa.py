@@ -1,17 +1,139 @@
 #!/usr/bin/env python3
 
 import os
+import sys
 import json
+import time
+import atexit
+import threading
+from functools import lru_cache
 import shutil
-import urllib3
+import ipaddress
 from hashlib import md5
-from socket import gethostbyname
-from argparse import ArgumentParser
-from xml.etree import ElementTree as eTree
-from datetime import datetime, timedelta
+from argparse import ArgumentParser, ArgumentTypeError, Namespace
+from datetime import datetime
+
+# requests, sqlite3, socket and concurrent.futures are imported by functions which use them,
+# so commands which don't need them start faster
+
+# lxml is optional, it parses and selects XML in C with precompiled XPath expressions
+try:
+    from lxml import etree as eTree
+    OBJECTS_BY_NAME = eTree.XPath('./OBJECT[@name=$name]')
+except ImportError:
+    from xml.etree import ElementTree as eTree
+    OBJECTS_BY_NAME = None
+
+# orjson is optional, it serializes output JSON several times faster than json module
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# File where we can find root CA
+CA_FILE = '/etc/pki/tls/certs/ca-bundle.crt'
+# Connection timeout in seconds (connection, read).
+API_TIMEOUT = (3, 10)
+
+# CLI component names to XML API mapping
+COMP_NAMES_MAP = {
+    'disks': 'drive', 'vdisks': 'virtual-disk', 'pools': 'pools', 'disk-groups': 'disk-group',
+    'volumes': 'volume', 'controllers': 'controllers', 'enclosures': 'enclosures',
+    'power-supplies': 'power-supplies', 'fans': 'fan-details', 'ports': 'ports'
+}
+
+# XML API prop names to Zabbix macro mapping
+COMP_PROPS_MAP = {
+    'vdisks': {'{#VDISK.ID}': 'name', '{#VDISK.TYPE}': 'storage-type'},
+    'fans': {'{#FAN.ID}': 'durable-id', '{#FAN.LOCATION}': 'location'},
+    'ports': {'{#PORT.ID}': 'port', '{#PORT.TYPE}': 'port-type', '{#PORT.SPEED}': 'actual-speed'},
+    'pools': {'{#POOL.ID}': 'name', '{#POOL.SN}': 'serial-number', '{#POOL.TYPE}': 'storage-type'},
+    'enclosures': {'{#ENCLOSURE.ID}': 'enclosure-id', '{#ENCLOSURE.SN}': 'midplane-serial-number'},
+    'volumes': {'{#VOLUME.ID}': 'volume-name', '{#VOLUME.SN}': 'serial-number', '{#VOLUME.TYPE}': 'volume-type'},
+    'power-supplies': {'{#POWERSUPPLY.ID}': 'durable-id', '{#POWERSUPPLY.LOCATION}': 'location',
+                       '{#POWERSUPPLY.NAME}': 'name'},
+    'disks': {'{#DISK.ID}': 'location', '{#DISK.SN}': 'serial-number', '{#DISK.MODEL}': 'model',
+              '{#DISK.ARCH}': 'architecture'},
+    'disk-groups': {'{#DG.ID}': 'name', '{#DG.SN}': 'serial-number', '{#DG.TYPE}': 'storage-type',
+                    '{#DG.TIER}': 'storage-tier'},
+    'controllers': {'{#CONTROLLER.ID}': 'controller-id', '{#CONTROLLER.SN}': 'serial-number',
+                    '{#CONTROLLER.IP}': 'ip-address', '{#CONTROLLER.WWN}': 'node-wwn'}
+}
+
+# LLD macros and their XML API prop names as tuple of pairs for every component
+_COMP_PROPS = {comp: tuple(props.items()) for comp, props in COMP_PROPS_MAP.items()}
+
+# Current program version
+VERSION = '0.7.4'
+
+# MSA components, which can be requested
+MSA_PARTS = ('disks', 'vdisks', 'controllers', 'enclosures', 'fans',
+             'power-supplies', 'ports', 'pools', 'disk-groups', 'volumes')
+
+# Temp directory with cache database
+DEFAULT_TMP_DIR = '/var/tmp/zbx-hpmsa/'
+
+# Main parser options for fast_parse_args(): option -> (dest, converter, choices), flags have no converter.
+FAST_OPTIONS = {
+    '-a': ('api', int, (1, 2)), '--api': ('api', int, (1, 2)),
+    '-u': ('username', str, None), '--username': ('username', str, None),
+    '-p': ('password', str, None), '--password': ('password', str, None),
+    '-f': ('login_file', str, None), '--login-file': ('login_file', str, None),
+    '-s': ('save_xml', str, None), '--save-xml': ('save_xml', str, None),
+    '-t': ('tmp_dir', str, None), '--tmp-dir': ('tmp_dir', str, None),
+    '--ssl': ('ssl', str, ('direct', 'verify')),
+    '--pretty': ('pretty', None, None),
+    '--human': ('human', None, None)
+}
+
+# Match dict for print output in human readable format, strings are interned as they're used as dict keys
+_HUMAN_KEY_MAP = {sys.intern(key): sys.intern(name) for key, name in {
+    'h': 'health', 's': 'status', 'ow': 'owner', 'owp': 'owner-preferred', 't': 'temperature',
+    'ts': 'temperature-status', 'cj': 'current-job', 'poh': 'power-on-hours', 'rs': 'redundancy-status',
+    'fw': 'firmware-version', 'sp': 'speed', 'ps': 'port-status', 'ss': 'sfp-status',
+    'fh': 'flash-health', 'fs': 'flash-status', '12v': 'power-12v', '5v': 'power-5v',
+    '33v': 'power-33v', '12i': 'power-12i', '5i': 'power-5i', 'io': 'iops', 'cpu': 'cpu-load',
+    'cjp': 'current-job-completion'
+}.items()}
+
+# Compact JSON encoder for the output consumed by Zabbix, used without orjson
+_ENCODER = json.JSONEncoder(separators=(',', ':')).encode
+
+# Connection to the cache database, opened on first use by get_cache_conn()
+_CONN = None
+
+# Cache database layout version, stored in 'PRAGMA user_version' once the schema is applied
+CACHE_VERSION = 2
+
+# Cache database tables and persistent WAL journal, applied on connect if the DB is older than CACHE_VERSION
+CACHE_SCHEMA = ('PRAGMA journal_mode=WAL; '
+                'CREATE TABLE IF NOT EXISTS skey_cache ('
+                'dns_name TEXT NOT NULL, '
+                'ip TEXT NOT NULL, '
+                'proto TEXT NOT NULL, '
+                'expired REAL NOT NULL, '
+                'skey TEXT NOT NULL DEFAULT 0, '
+                'PRIMARY KEY (dns_name, ip, proto)); '
+                'PRAGMA user_version={};'.format(CACHE_VERSION)
+                )
+
+# Table layout of 'cache --show' output
+CACHE_HEADER = '{:^30} {:^15} {:^7} {:^19} {:^32}\n{:-^30} {:-^15} {:-^7} {:-^19} {:-^32}'.format(
+    'hostname', 'ip', 'proto', 'expired', 'sessionkey', '-', '-', '-', '-', '-')
+CACHE_ROW = '{:30} {:15} {:^7} {:19} {:32}'
+
+# Session key lifetime in seconds, it's prolonged only after the storage accepted the key
+SKEY_LIFETIME = 1800
+# API return codes for rejected session key, '401' is HTTP status returned instead of XML by some firmwares
+SKEY_REJECTED_CODES = ('-10027', '401')
+# Rejected session keys and keys got instead of them
+_SKEY_LOCK = threading.Lock()
+_RENEWED_SKEYS = {}
+# Session keys which lifetime is already prolonged in this run
+_PROLONGED_SKEYS = set()
 
-import sqlite3
-import requests
+# Maximum of parallel API requests of batch commands
+BATCH_MAX_WORKERS = 8
 
 
 def install_script(tmp_dir, group):
@@ -38,14 +160,7 @@ def install_script(tmp_dir, group):
 
     # Init cache db
     if not os.path.exists(CACHE_DB):
-        sql_cmd('CREATE TABLE IF NOT EXISTS skey_cache ('
-                'dns_name TEXT NOT NULL, '
-                'ip TEXT NOT NULL, '
-                'proto TEXT NOT NULL, '
-                'expired TEXT NOT NULL, '
-                'skey TEXT NOT NULL DEFAULT 0, '
-                'PRIMARY KEY (dns_name, ip, proto))'
-                )
+        get_cache_conn()
         os.chmod(CACHE_DB, 0o664)
         print("Cache database initialized as: '{}'".format(CACHE_DB))
 
@@ -59,6 +174,20 @@ def install_script(tmp_dir, group):
               "You must manually check access rights to '{}' for zabbix_server".format(group, CACHE_DB))
 
 
+@lru_cache(maxsize=16)
+def hash_login(login):
+    """
+    Return md5 hash of login string.
+
+    :param login: Login string in 'user_password' format.
+    :type login: str
+    :return: md5 hash.
+    :rtype: str
+    """
+
+    return md5(login.encode()).hexdigest()
+
+
 def make_cred_hash(cred, isfile=False):
     """
     Return md5 hash of login string.
@@ -76,43 +205,76 @@ def make_cred_hash(cred, isfile=False):
             with open(cred, 'r') as login_file:
                 login_data = login_file.readline().replace('\n', '').strip()
                 if login_data.find('_') != -1:
-                    hashed = md5(login_data.encode()).hexdigest()
+                    hashed = hash_login(login_data)
                 else:
                     hashed = login_data
         except FileNotFoundError:
             raise SystemExit("ERROR: File with login data doesn't exists: {}".format(cred))
     else:
-        hashed = md5(cred.encode()).hexdigest()
+        hashed = hash_login(cred)
     return hashed
 
 
-def sql_cmd(query, fetch_all=False):
+def get_cache_conn():
+    """
+    Return connection to the cache database, opening it on the first call.
+
+    :return: Connection to CACHE_DB in autocommit mode.
+    :rtype: sqlite3.Connection
+    """
+
+    global _CONN
+    if _CONN is None:
+        import sqlite3
+        conn = sqlite3.connect(CACHE_DB, isolation_level=None, check_same_thread=False)
+        try:
+            conn.executescript('PRAGMA synchronous=NORMAL; '
+                               'PRAGMA temp_store=MEMORY; '
+                               'PRAGMA cache_size=-8000;'
+                               )
+            # Journal mode is stored in the DB file, so it's set along with the schema only once
+            if conn.execute('PRAGMA user_version').fetchone()[0] < CACHE_VERSION:
+                # Login hashes cached by layout 1 are dropped and their pages are wiped, new DB doesn't need it.
+                # It's done before user_version is set, so it's tried again if the DB is locked.
+                if conn.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='cred_cache'").fetchone():
+                    conn.executescript('DROP TABLE cred_cache; VACUUM;')
+                conn.executescript(CACHE_SCHEMA)
+        except sqlite3.Error:
+            # Connection isn't kept half initialized, the next call tries again
+            conn.close()
+            raise
+        _CONN = conn
+        atexit.register(_CONN.close)
+    return _CONN
+
+
+def sql_cmd(query, params=(), stream=False):
     """
     Check and execute SQL query.
 
-    :param query: SQL query to execute.
+    :param query: SQL query to execute, may contain '?' placeholders.
     :type query: str
-    :param fetch_all: Set it True to execute fetchall().
-    :type fetch_all: bool
-    :return: Tuple with SQL query result.
-    :rtype: tuple
+    :param params: Values for query placeholders.
+    :type params: tuple
+    :param stream: Set it True to get cursor to iterate over all result rows.
+    :type stream: bool
+    :return: Tuple with the first row of SQL query result or cursor.
+    :rtype: Union[tuple, sqlite3.Cursor]
     """
 
+    import sqlite3
     try:
-        conn = sqlite3.connect(CACHE_DB)
-        cursor = conn.cursor()
+        conn = get_cache_conn()
         try:
-            if not fetch_all:
-                data = cursor.execute(query).fetchone()
+            if not stream:
+                data = conn.execute(query, params).fetchone()
             else:
-                data = cursor.execute(query).fetchall()
+                data = conn.execute(query, params)
         except sqlite3.OperationalError as e:
             if str(e).startswith('no such table'):
                 raise SystemExit("Cache is empty")
             else:
                 raise SystemExit('ERROR: {}. Query: {}'.format(e, query))
-        conn.commit()
-        conn.close()
         return data
     except sqlite3.OperationalError as e:
         print("CACHE ERROR: (db: {}) {}".format(CACHE_DB, e))
@@ -126,13 +288,35 @@ def display_cache():
     :rtype: None
     """
 
-    print("{:^30} {:^15} {:^7} {:^19} {:^32}".format('hostname', 'ip', 'proto', 'expired', 'sessionkey'))
-    print("{:-^30} {:-^15} {:-^7} {:-^19} {:-^32}".format('-', '-', '-', '-', '-'))
+    print(CACHE_HEADER)
+
+    cursor = sql_cmd('SELECT * FROM skey_cache', stream=True)
+    if cursor is None:
+        return
+    for name, ip, proto, expired, sessionkey in cursor:
+        print(CACHE_ROW.format(name, ip, proto, datetime.fromtimestamp(float(expired)).strftime("%H:%M:%S %d.%m.%Y"),
+                               sessionkey))
+
+
+def resolve_msa(dns_name):
+    """
+    Resolve MSA DNS name to IP address.
+    While a session key for the name is cached, the address is taken from the cache without DNS query.
+
+    :param dns_name: MSA DNS name.
+    :type dns_name: str
+    :return: MSA IP address.
+    :rtype: str
+    """
 
-    for cache in sql_cmd('SELECT * FROM skey_cache', fetch_all=True):
-        name, ip, proto, expired, sessionkey = cache
-        print("{:30} {:15} {:^7} {:19} {:32}".format(
-            name, ip, proto, datetime.fromtimestamp(float(expired)).strftime("%H:%M:%S %d.%m.%Y"), sessionkey))
+    cache_data = sql_cmd('SELECT ip FROM skey_cache WHERE dns_name=? AND expired>?', (dns_name, time.time()))
+    if cache_data is not None:
+        return cache_data[0]
+    from socket import gethostbyname
+    try:
+        return gethostbyname(dns_name)
+    except OSError as e:
+        raise SystemExit("ERROR: Cannot resolve '{}': {}".format(dns_name, e))
 
 
 def get_skey(msa, hashed_login, use_cache=True):
@@ -151,190 +335,320 @@ def get_skey(msa, hashed_login, use_cache=True):
 
     # Trying to use cached session key
     if use_cache:
-        cur_timestamp = datetime.timestamp(datetime.utcnow())
+        cur_timestamp = time.time()
         if not USE_SSL:  # http
-            cache_data = sql_cmd('SELECT expired,skey FROM skey_cache WHERE ip="{}" AND proto="http"'.format(msa[0]))
+            cache_data = sql_cmd("SELECT skey FROM skey_cache WHERE ip=? AND proto='http' AND expired>?",
+                                 (msa[0], cur_timestamp))
         else:  # https
-            cache_data = sql_cmd('SELECT expired,skey '
-                                 'FROM skey_cache '
-                                 'WHERE dns_name="{}" AND IP ="{}" AND proto="https"'.format(msa[1], msa[0])
-                                 )
+            cache_data = sql_cmd("SELECT skey FROM skey_cache "
+                                 "WHERE dns_name=? AND ip=? AND proto='https' AND expired>?",
+                                 (msa[1], msa[0], cur_timestamp))
+        # Key is prolonged by fetch_component() while the storage accepts it, so expired key isn't used any more
         if cache_data is not None:
-            cache_expired, cached_skey = cache_data
-            if cur_timestamp < float(cache_expired):
-                return cached_skey
-            else:
-                return get_skey(msa, hashed_login, use_cache=False)
-        else:
-            return get_skey(msa, hashed_login, use_cache=False)
+            return cache_data[0]
+
+    # Cache is missed, forming URL and trying to make GET query
+    msa_conn = msa[1] if VERIFY_SSL else msa[0]
+    url = '{}/api/login/{}'.format(msa_conn, hashed_login)
+    ret_code, sessionkey, xml = query_xmlapi(url=url, sessionkey=None)
+
+    # 1 - success, write sessionkey to DB and return it
+    if ret_code == '1':
+        expired = time.time() + SKEY_LIFETIME
+        proto = 'https' if USE_SSL else 'http'
+        sql_cmd('INSERT OR REPLACE INTO skey_cache VALUES (?, ?, ?, ?, ?)',
+                (msa[1], msa[0], proto, expired, sessionkey))
+        return sessionkey
+    # 2 - Authentication Unsuccessful, return "2"
+    elif ret_code == '2':
+        return ret_code
+
+
+def renew_skey(msa, sessionkey):
+    """
+    Get new session key instead of rejected by the storage. Parallel requests share one login.
+
+    :param msa: MSA IP address and DNS name.
+    :type msa: tuple
+    :param sessionkey: Rejected session key.
+    :type sessionkey: str
+    :return: New session key or error code.
+    :rtype: str
+    """
+
+    with _SKEY_LOCK:
+        if sessionkey not in _RENEWED_SKEYS:
+            # Invalidate rejected key, so it won't be used again if login fails
+            sql_cmd('DELETE FROM skey_cache WHERE skey=?', (sessionkey,))
+            _RENEWED_SKEYS[sessionkey] = get_skey(msa, CRED_HASH, use_cache=False)
+        return _RENEWED_SKEYS[sessionkey]
+
+
+def make_session():
+    """
+    Make HTTP session, which keeps connections to the storage alive between API requests.
+
+    :return: HTTP session.
+    :rtype: requests.Session
+    """
+
+    import urllib3
+    import requests
+    from requests.adapters import HTTPAdapter
+
+    # Storages with self-signed certificates are used with '--ssl direct', so don't warn about it on every request
+    urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+
+    session = requests.Session()
+    session.mount('http://', HTTPAdapter(pool_connections=4, pool_maxsize=16))
+    session.mount('https://', HTTPAdapter(pool_connections=4, pool_maxsize=16))
+    session.headers.update({'Connection': 'keep-alive'})
+    return session
+
+
+def make_query(use_ssl, verify_ssl, api_version, save_xml, username):
+    """
+    Make function for requests to HP MSA XML API, specialized once for connection settings of the run.
+
+    :param use_ssl: Use HTTPS connection.
+    :type use_ssl: bool
+    :param verify_ssl: Verify storage SSL certificate.
+    :type verify_ssl: bool
+    :param api_version: MSA API version.
+    :type api_version: int
+    :param save_xml: Path to the file to save response in or None.
+    :type save_xml: Union[str, None]
+    :param username: Username, used for API version 1 cookie.
+    :type username: str
+    :return: query_xmlapi(url, sessionkey) function.
+    :rtype: function
+    """
+
+    import requests
+    session = make_session()
+    scheme = 'https://' if use_ssl else 'http://'
+    verify = (CA_FILE if verify_ssl else False) if use_ssl else True
+    if api_version == 2:
+        def make_headers(sessionkey):
+            return {'sessionKey': sessionkey}
     else:
-        # Forming URL and trying to make GET query
-        msa_conn = msa[1] if VERIFY_SSL else msa[0]
-        url = '{}/api/login/{}'.format(msa_conn, hashed_login)
-        ret_code, sessionkey, xml = query_xmlapi(url=url, sessionkey=None)
-
-        # 1 - success, write sessionkey to DB and return it
-        if ret_code == '1':
-            expired = datetime.timestamp(datetime.utcnow() + timedelta(minutes=30))
-            if not USE_SSL:
-                cache_data = sql_cmd('SELECT ip FROM skey_cache WHERE ip = "{}" AND proto="http"'.format(msa[0]))
-                if cache_data is None:
-                    sql_cmd('INSERT INTO skey_cache VALUES ('
-                            '"{dns}", "{ip}", "http", "{time}", "{skey}")'.format(dns=msa[1], ip=msa[0],
-                                                                                  time=expired, skey=sessionkey)
-                            )
-                else:
-                    sql_cmd('UPDATE skey_cache SET skey="{skey}", expired="{expired}" '
-                            'WHERE ip="{ip}" AND proto="http"'.format(skey=sessionkey, expired=expired, ip=msa[0])
-                            )
-            else:
-                cache_data = sql_cmd('SELECT dns_name, ip FROM skey_cache '
-                                     'WHERE dns_name="{}" AND ip="{}" AND proto="https"'.format(msa[1], msa[0]))
-                if cache_data is None:
-                    sql_cmd('INSERT INTO skey_cache VALUES ('
-                            '"{name}", "{ip}", "https", "{expired}", "{skey}")'.format(name=msa[1], ip=msa[0],
-                                                                                       expired=expired,
-                                                                                       skey=sessionkey
-                                                                                       )
-                            )
-                else:
-                    sql_cmd('UPDATE skey_cache SET skey = "{skey}", expired = "{expired}" '
-                            'WHERE dns_name="{name}" AND ip="{ip}" AND proto="https"'.format(skey=sessionkey,
-                                                                                             expired=expired,
-                                                                                             name=msa[1],
-                                                                                             ip=msa[0]
-                                                                                             )
-                            )
-            return sessionkey
-        # 2 - Authentication Unsuccessful, return "2"
-        elif ret_code == '2':
-            return ret_code
-
-
-def query_xmlapi(url, sessionkey):
-    """
-    Making HTTP(s) request to HP MSA XML API.
-
-    :param url: URL to make GET request.
-    :type url: str
-    :param sessionkey: Session key to authorize.
-    :type sessionkey: Union[str, None]
+        cookie = 'wbiusername={}; wbisessionkey='.format(username)
+
+        def make_headers(sessionkey):
+            return {'Cookie': '{}{}'.format(cookie, sessionkey)}
+
+    def query_xmlapi(url, sessionkey):
+        """
+        Making HTTP(s) request to HP MSA XML API.
+
+        :param url: URL to make GET request.
+        :type url: str
+        :param sessionkey: Session key to authorize.
+        :type sessionkey: Union[str, None]
+        :return: Tuple with return code, return description and etree object <xml.etree.ElementTree.Element>.
+        :rtype: tuple
+        """
+
+        # Makes GET request to URL
+        try:
+            response = session.get(scheme + url, headers=make_headers(sessionkey), verify=verify,
+                                   timeout=API_TIMEOUT, stream=True)
+        except requests.exceptions.SSLError:
+            raise SystemExit('ERROR: Cannot verify storage SSL Certificate.')
+        except requests.exceptions.ConnectTimeout:
+            raise SystemExit('ERROR: Timeout occurred!')
+        except requests.exceptions.ConnectionError as e:
+            raise SystemExit("ERROR: Cannot connect to storage {}.".format(e))
+
+        if response.status_code == 401:
+            response.close()
+            return '401', response.reason, None
+        return read_xml_response(response, save_xml if 'login' not in url else None)
+
+    return query_xmlapi
+
+
+def read_xml_response(response, save_path=None):
+    """
+    Parse HP MSA XML API response, it's parsed by chunks while they are received.
+
+    :param response: Streamed response of XML API request.
+    :type response: requests.Response
+    :param save_path: Path to the file to save response in.
+    :type save_path: Union[str, None]
     :return: Tuple with return code, return description and etree object <xml.etree.ElementTree.Element>.
     :rtype: tuple
     """
 
-    # Set file where we can find root CA
-    ca_file = '/etc/pki/tls/certs/ca-bundle.crt'
-
-    # Makes GET request to URL
-    try:
-        # Connection timeout in seconds (connection, read).
-        timeout = (3, 10)
-        full_url = 'https://' + url if USE_SSL else 'http://' + url
-        headers = {'sessionKey': sessionkey} if API_VERSION == 2 else {
-            'Cookie': "wbiusername={}; wbisessionkey={}".format(MSA_USERNAME, sessionkey)}
-        if USE_SSL:
-            if VERIFY_SSL:
-                response = requests.get(full_url, headers=headers, verify=ca_file, timeout=timeout)
-            else:
-                urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
-                response = requests.get(full_url, headers=headers, verify=False, timeout=timeout)
-        else:
-            response = requests.get(full_url, headers=headers, timeout=timeout)
-    except requests.exceptions.SSLError:
-        raise SystemExit('ERROR: Cannot verify storage SSL Certificate.')
-    except requests.exceptions.ConnectTimeout:
-        raise SystemExit('ERROR: Timeout occurred!')
-    except requests.exceptions.ConnectionError as e:
-        raise SystemExit("ERROR: Cannot connect to storage {}.".format(e))
-
-    # Reading data from server XML response
+    from requests.exceptions import RequestException
     try:
-        if SAVE_XML is not None and 'login' not in url:
+        parser = eTree.XMLParser()
+        xml_file = None
+        if save_path is not None:
             try:
-                with open(SAVE_XML[0], 'w') as xml_file:
-                    xml_file.write(response.text)
+                xml_file = open(save_path, 'wb')
             except PermissionError:
-                raise SystemExit('ERROR: Cannot save XML file to "{}"'.format(args.savexml))
-        response_xml = eTree.fromstring(response.content)
-        return_code = response_xml.find("./OBJECT[@name='status']/PROPERTY[@name='return-code']").text
-        return_response = response_xml.find("./OBJECT[@name='status']/PROPERTY[@name='response']").text
+                raise SystemExit('ERROR: Cannot save XML file to "{}"'.format(save_path))
+        try:
+            for chunk in response.iter_content(chunk_size=65536):
+                parser.feed(chunk)
+                if xml_file is not None:
+                    xml_file.write(chunk)
+        except RequestException as e:
+            raise SystemExit("ERROR: Cannot read storage response {}.".format(e))
+        finally:
+            if xml_file is not None:
+                xml_file.close()
+        response_xml = parser.close()
+        status = get_props(find_objects(response_xml, 'status')[0])
+        return_code = status['return-code']
+        return_response = status['response']
 
         return return_code, return_response, response_xml
-    except (ValueError, AttributeError) as e:
+    except (ValueError, IndexError, KeyError, eTree.ParseError) as e:
         raise SystemExit("ERROR: Cannot parse XML. {}".format(e))
 
 
-def make_lld(msa, component, sessionkey, pretty=False):
+def fetch_component(msa, component, sessionkey):
     """
-    Form LLD JSON for Zabbix server.
+    Request storage component from HP MSA XML API and return parsed response.
 
     :param msa: MSA DNS name and IP address.
     :type msa: tuple
+    :param component: API path of storage component after '/api/show/'.
+    :type component: str
     :param sessionkey: Session key.
     :type sessionkey: str
-    :param pretty: Print output in pretty format
-    :type pretty: int
-    :param component: Name of storage component.
-    :type component: str
-    :return: JSON with discovery data.
-    :rtype: str
+    :return: etree object <xml.etree.ElementTree.Element>.
+    :rtype: xml.etree.ElementTree.Element
     """
 
+    sessionkey = _RENEWED_SKEYS.get(sessionkey, sessionkey)
+
     # Forming URL
     msa_conn = msa[1] if VERIFY_SSL else msa[0]
     url = '{strg}/api/show/{comp}'.format(strg=msa_conn, comp=component)
 
     # Making request to the API
     resp_return_code, resp_description, xml = query_xmlapi(url, sessionkey)
+    # Session key is expired on the storage, login again and repeat request once
+    if resp_return_code in SKEY_REJECTED_CODES:
+        sessionkey = renew_skey(msa, sessionkey)
+        resp_return_code, resp_description, xml = query_xmlapi(url, sessionkey)
     if resp_return_code != '0':
         raise SystemExit('ERROR: {rc} : {rd}'.format(rc=resp_return_code, rd=resp_description))
 
-    # CLI component names to XML API mapping
-    comp_names_map = {
-        'disks': 'drive', 'vdisks': 'virtual-disk', 'pools': 'pools', 'disk-groups': 'disk-group',
-        'volumes': 'volume', 'controllers': 'controllers', 'enclosures': 'enclosures',
-        'power-supplies': 'power-supplies', 'fans': 'fan-details', 'ports': 'ports'
-    }
-    # XML API prop names to Zabbix macro mapping
-    comp_props_map = {
-        'vdisks': {'{#VDISK.ID}': 'name', '{#VDISK.TYPE}': 'storage-type'},
-        'fans': {'{#FAN.ID}': 'durable-id', '{#FAN.LOCATION}': 'location'},
-        'ports': {'{#PORT.ID}': 'port', '{#PORT.TYPE}': 'port-type', '{#PORT.SPEED}': 'actual-speed'},
-        'pools': {'{#POOL.ID}': 'name', '{#POOL.SN}': 'serial-number', '{#POOL.TYPE}': 'storage-type'},
-        'enclosures': {'{#ENCLOSURE.ID}': 'enclosure-id', '{#ENCLOSURE.SN}': 'midplane-serial-number'},
-        'volumes': {'{#VOLUME.ID}': 'volume-name', '{#VOLUME.SN}': 'serial-number', '{#VOLUME.TYPE}': 'volume-type'},
-        'power-supplies': {'{#POWERSUPPLY.ID}': 'durable-id', '{#POWERSUPPLY.LOCATION}': 'location',
-                           '{#POWERSUPPLY.NAME}': 'name'},
-        'disks': {'{#DISK.ID}': 'location', '{#DISK.SN}': 'serial-number', '{#DISK.MODEL}': 'model',
-                  '{#DISK.ARCH}': 'architecture'},
-        'disk-groups': {'{#DG.ID}': 'name', '{#DG.SN}': 'serial-number', '{#DG.TYPE}': 'storage-type',
-                        '{#DG.TIER}': 'storage-tier'},
-        'controllers': {'{#CONTROLLER.ID}': 'controller-id', '{#CONTROLLER.SN}': 'serial-number',
-                        '{#CONTROLLER.IP}': 'ip-address', '{#CONTROLLER.WWN}': 'node-wwn'}
-    }
+    # Session timeout of MSA is idle timeout, so the accepted key is prolonged once per run
+    if sessionkey not in _PROLONGED_SKEYS:
+        _PROLONGED_SKEYS.add(sessionkey)
+        sql_cmd('UPDATE skey_cache SET expired=? WHERE skey=?', (time.time() + SKEY_LIFETIME, sessionkey))
+    return xml
+
+
+def find_objects(xml, name):
+    """
+    Find all child objects of XML API response with given name.
+
+    :param xml: XML API response or object.
+    :type xml: xml.etree.ElementTree.Element
+    :param name: Value of object 'name' attribute.
+    :type name: str
+    :return: List of found objects.
+    :rtype: list
+    """
+
+    if OBJECTS_BY_NAME is not None:
+        return OBJECTS_BY_NAME(xml, name=name)
+    return xml.findall("./OBJECT[@name='{}']".format(name))
+
+
+def get_props(obj):
+    """
+    Collect all PROPERTY children of XML API object with a single pass.
+
+    :param obj: XML API object.
+    :type obj: xml.etree.ElementTree.Element
+    :return: Dictionary with property names as keys and their text as values.
+    :rtype: dict
+    """
+
+    # Property names repeat in every object, so intern them to share one string per name, nameless ones are skipped
+    return {sys.intern(child.get('name')): child.text for child in obj
+            if child.tag == 'PROPERTY' and child.get('name') is not None}
+
+
+def dump_json(data, pretty=None):
+    """
+    Serialize data to JSON encoded as UTF-8 bytes, ready to be written to stdout.
+    orjson writes non-ASCII characters as is, json module writes them as '\\uXXXX' escapes.
+
+    :param data: Data to serialize.
+    :type data: Union[dict, list]
+    :param pretty: Indent size to print in pretty format, compact output if None. orjson always indents by 2.
+    :type pretty: int
+    :return: JSON bytes.
+    :rtype: bytes
+    """
+
+    if orjson is not None:
+        # Component id is None if its property is empty, json module writes such key as "null" and so does orjson
+        option = orjson.OPT_NON_STR_KEYS | (orjson.OPT_INDENT_2 if pretty else 0)
+        return orjson.dumps(data, option=option)
+    if pretty:
+        return json.dumps(data, separators=(',', ':'), indent=pretty).encode()
+    return _ENCODER(data).encode()
+
+
+def make_lld(msa, component, sessionkey, pretty=False):
+    """
+    Form LLD JSON for Zabbix server.
+
+    :param msa: MSA DNS name and IP address.
+    :type msa: tuple
+    :param sessionkey: Session key.
+    :type sessionkey: str
+    :param pretty: Print output in pretty format
+    :type pretty: int
+    :param component: Name of storage component.
+    :type component: str
+    :return: JSON with discovery data.
+    :rtype: bytes
+    """
+
+    return dump_json({"data": get_lld_data(msa, component, sessionkey)}, pretty)
+
+
+def get_lld_data(msa, component, sessionkey):
+    """
+    Collect LLD macros of all storage component objects.
+
+    :param msa: MSA DNS name and IP address.
+    :type msa: tuple
+    :param component: Name of storage component.
+    :type component: str
+    :param sessionkey: Session key.
+    :type sessionkey: str
+    :return: List of dicts with LLD macros.
+    :rtype: list
+    """
+
+    xml = fetch_component(msa, component, sessionkey)
 
     # Processing response
     all_components = []
-    for part in xml.findall("./OBJECT[@name='{}']".format(comp_names_map[component])):
-        lld_dict = {}
-        for macro, prop in comp_props_map[component].items():
-            try:
-                xml_prop_value = part.find("./PROPERTY[@name='{}']".format(prop)).text
-            except AttributeError:
-                xml_prop_value = "UNKNOWN"
-            lld_dict[macro] = xml_prop_value
+    comp_props = _COMP_PROPS[component]
+    for part in find_objects(xml, COMP_NAMES_MAP[component]):
+        props = get_props(part)
+        lld_dict = {macro: props.get(prop, "UNKNOWN") for macro, prop in comp_props}
         # Dirty workaround for SFP present status
         if component == 'ports':
-            try:
-                port_sfp = part.find("./OBJECT[@name='port-details']/PROPERTY[@name='sfp-present']").text
-            except AttributeError:
-                port_sfp = "UNKNOWN"
-            lld_dict['{#PORT.SFP}'] = port_sfp
+            port_details = find_objects(part, 'port-details')
+            if port_details:
+                lld_dict['{#PORT.SFP}'] = get_props(port_details[0]).get('sfp-present', "UNKNOWN")
+            else:
+                lld_dict['{#PORT.SFP}'] = "UNKNOWN"
         all_components.append(lld_dict)
-
-    # Dumps JSON and return it
-    return json.dumps({"data": all_components}, separators=(',', ':'), indent=pretty)
+    return all_components
 
 
 def get_full_json(msa, component, sessionkey, pretty=False, human=False):
@@ -352,346 +666,427 @@ def get_full_json(msa, component, sessionkey, pretty=False, human=False):
     :param human: Expand result dict keys in human readable format
     :type: bool
     :return: JSON with all found data.
-    :rtype: str
+    :rtype: bytes
     """
 
-    # Forming URL
-    msa_conn = msa[1] if VERIFY_SSL else msa[0]
-    url = '{strg}/api/show/{comp}'.format(strg=msa_conn, comp=component)
+    return dump_json(get_full_data(msa, component, sessionkey, human), pretty)
 
-    # Making request to API
-    resp_return_code, resp_description, xml = query_xmlapi(url, sessionkey)
-    if resp_return_code != '0':
-        raise SystemExit('ERROR: {rc} : {rd}'.format(rc=resp_return_code, rd=resp_description))
+
+def get_full_data(msa, component, sessionkey, human=False):
+    """
+    Collect metrics of all storage component objects.
+
+    :param msa: MSA DNS name and IP address.
+    :type msa: tuple
+    :param component: Name of storage component.
+    :type component: str
+    :param sessionkey: Session key.
+    :type sessionkey: str
+    :param human: Expand result dict keys in human readable format
+    :type: bool
+    :return: Dictionary with metrics by component id.
+    :rtype: dict
+    """
+
+    xml = fetch_component(msa, component, sessionkey)
 
     # Processing XML
     all_components = {}
     if component == 'disks':
-        for PROP in xml.findall("./OBJECT[@name='drive']"):
+        for PROP in find_objects(xml, 'drive'):
+            props = get_props(PROP)
             # Processing main properties
-            disk_location = PROP.find("./PROPERTY[@name='location']").text
-            disk_health_num = PROP.find("./PROPERTY[@name='health-numeric']").text
+            disk_location = props.get('location')
+            disk_health_num = props.get('health-numeric')
             disk_full_data = {
                 "h": disk_health_num
             }
 
             # Processing advanced properties
             disk_ext = dict()
-            disk_ext['t'] = PROP.find("./PROPERTY[@name='temperature-numeric']")
-            disk_ext['ts'] = PROP.find("./PROPERTY[@name='temperature-status-numeric']")
-            disk_ext['cj'] = PROP.find("./PROPERTY[@name='job-running-numeric']")
-            disk_ext['poh'] = PROP.find("./PROPERTY[@name='power-on-hours']")
-            for prop, value in disk_ext.items():
-                if value is not None:
-                    disk_full_data[prop] = value.text
+            disk_ext['t'] = 'temperature-numeric'
+            disk_ext['ts'] = 'temperature-status-numeric'
+            disk_ext['cj'] = 'job-running-numeric'
+            disk_ext['poh'] = 'power-on-hours'
+            for prop, name in disk_ext.items():
+                if name in props:
+                    disk_full_data[prop] = props[name]
             all_components[disk_location] = disk_full_data
     elif component == 'vdisks':
-        for PROP in xml.findall("./OBJECT[@name='virtual-disk']"):
-            vdisk_name = PROP.find("./PROPERTY[@name='name']").text
-            vdisk_health_num = PROP.find("./PROPERTY[@name='health-numeric']").text
-            vdisk_status_num = PROP.find("./PROPERTY[@name='status-numeric']").text
-            vdisk_owner_num = PROP.find("./PROPERTY[@name='owner-numeric']").text
-            vdisk_owner_pref_num = PROP.find("./PROPERTY[@name='preferred-owner-numeric']").text
+        for PROP in find_objects(xml, 'virtual-disk'):
+            props = get_props(PROP)
+            vdisk_name = props.get('name')
             vdisk_full_data = {
-                "h": vdisk_health_num,
-                "s": vdisk_status_num,
-                "ow": vdisk_owner_num,
-                "owp": vdisk_owner_pref_num
+                "h": props.get('health-numeric'),
+                "s": props.get('status-numeric'),
+                "ow": props.get('owner-numeric'),
+                "owp": props.get('preferred-owner-numeric')
             }
             all_components[vdisk_name] = vdisk_full_data
     elif component == 'pools':
-        for PROP in xml.findall("./OBJECT[@name='pools']"):
-            pool_sn = PROP.find("./PROPERTY[@name='serial-number']").text
-            pool_health = PROP.find("./PROPERTY[@name='health']").text
-            pool_healthreason = PROP.find("./PROPERTY[@name='health-reason']").text
-            pool_healthrecommendation = PROP.find("./PROPERTY[@name='health-recommendation']").text
-            pool_health_num = PROP.find("./PROPERTY[@name='health-numeric']").text
-            pool_owner_num = PROP.find("./PROPERTY[@name='owner-numeric']").text
-            pool_owner_pref_num = PROP.find("./PROPERTY[@name='preferred-owner-numeric']").text
-            pool_storage_type = PROP.find("./PROPERTY[@name='storage-type']").text
-            pool_block_size = PROP.find("./PROPERTY[@name='blocksize']").text
-            pool_totalsize = PROP.find("./PROPERTY[@name='total-size']").text
-            pool_totalsize_num = PROP.find("./PROPERTY[@name='total-size-numeric']").text
-            pool_totalavail = PROP.find("./PROPERTY[@name='total-avail']").text
-            pool_totalavail_num = PROP.find("./PROPERTY[@name='total-avail-numeric']").text
-            pool_diskgroups = PROP.find("./PROPERTY[@name='disk-groups']").text
-            pool_volumes = PROP.find("./PROPERTY[@name='volumes']").text
-            pool_pagesize = PROP.find("./PROPERTY[@name='page-size']").text
-            pool_pagesize_num = PROP.find("./PROPERTY[@name='page-size-numeric']").text
-            pool_lowthreshold = PROP.find("./PROPERTY[@name='low-threshold']").text
-            pool_middlethreshold = PROP.find("./PROPERTY[@name='middle-threshold']").text
-            pool_highthreshold = PROP.find("./PROPERTY[@name='high-threshold']").text
+        for PROP in find_objects(xml, 'pools'):
+            props = get_props(PROP)
+            pool_sn = props.get('serial-number')
             pool_full_data = {
-                "h": pool_health_num,
-                "hc": pool_health,
-                "hr": pool_healthreason,
-                "hrc": pool_healthrecommendation,
+                "h": props.get('health-numeric'),
+                "hc": props.get('health'),
+                "hr": props.get('health-reason'),
+                "hrc": props.get('health-recommendation'),
                 "sn": pool_sn,
-                "ow": pool_owner_num,
-                "owp": pool_owner_pref_num,
-                "pst": pool_storage_type,
-                "bs": pool_block_size,
-                "ts": pool_totalsize,
-                "tsn": pool_totalsize_num,
-                "ta": pool_totalavail,
-                "tan": pool_totalavail_num,
-                "dgs": pool_diskgroups,
-                "vms": pool_volumes,
-                "ps": pool_pagesize,
-                "psn": pool_pagesize_num,
-                "lts": pool_lowthreshold,
-                "mts": pool_middlethreshold,
-                "hts": pool_highthreshold
-                
+                "ow": props.get('owner-numeric'),
+                "owp": props.get('preferred-owner-numeric'),
+                "pst": props.get('storage-type'),
+                "bs": props.get('blocksize'),
+                "ts": props.get('total-size'),
+                "tsn": props.get('total-size-numeric'),
+                "ta": props.get('total-avail'),
+                "tan": props.get('total-avail-numeric'),
+                "dgs": props.get('disk-groups'),
+                "vms": props.get('volumes'),
+                "ps": props.get('page-size'),
+                "psn": props.get('page-size-numeric'),
+                "lts": props.get('low-threshold'),
+                "mts": props.get('middle-threshold'),
+                "hts": props.get('high-threshold')
             }
             all_components[pool_sn] = pool_full_data
     elif component == 'disk-groups':
-        for PROP in xml.findall("./OBJECT[@name='disk-group']"):
-            dg_sn = PROP.find(".PROPERTY[@name='serial-number']").text
-            dg_health_num = PROP.find("./PROPERTY[@name='health-numeric']").text
-            dg_status_num = PROP.find("./PROPERTY[@name='status-numeric']").text
-            dg_owner_num = PROP.find("./PROPERTY[@name='owner-numeric']").text
-            dg_owner_pref_num = PROP.find("./PROPERTY[@name='preferred-owner-numeric']").text
-            dg_curr_job_num = PROP.find("./PROPERTY[@name='current-job-numeric']").text
-            dg_curr_job_pct = PROP.find("./PROPERTY[@name='current-job-completion']").text
-            dg_blocksize = PROP.find("./PROPERTY[@name='blocksize']").text
-            dg_size = PROP.find("./PROPERTY[@name='size']").text
-            dg_size_num = PROP.find("./PROPERTY[@name='size-numeric']").text
-            dg_freespace = PROP.find("./PROPERTY[@name='freespace']").text
-            dg_freespace_num = PROP.find("./PROPERTY[@name='freespace-numeric']").text
-            dg_raw_size = PROP.find("./PROPERTY[@name='raw-size']").text
-            dg_raw_size_num = PROP.find("./PROPERTY[@name='raw-size-numeric']").text
-                        
+        for PROP in find_objects(xml, 'disk-group'):
+            props = get_props(PROP)
+            dg_sn = props.get('serial-number')
+            dg_curr_job_pct = props.get('current-job-completion')
+
             # current job completion return None if job isn't running, so I'm replacing it with zero if None
             if dg_curr_job_pct is None:
                 dg_curr_job_pct = '0'
             dg_full_data = {
-                "h": dg_health_num,
-                "s": dg_status_num,
-                "ow": dg_owner_num,
-                "owp": dg_owner_pref_num,
-                "cj": dg_curr_job_num,
+                "h": props.get('health-numeric'),
+                "s": props.get('status-numeric'),
+                "ow": props.get('owner-numeric'),
+                "owp": props.get('preferred-owner-numeric'),
+                "cj": props.get('current-job-numeric'),
                 "cjp": dg_curr_job_pct.rstrip('%'),
-                "bs": dg_blocksize,
-                "sz": dg_size,
-                "szn": dg_size_num,
-                "fr": dg_freespace,
-                "frn": dg_freespace_num,
-                "rs": dg_raw_size,
-                "rsn": dg_raw_size_num,
-                
-                
+                "bs": props.get('blocksize'),
+                "sz": props.get('size'),
+                "szn": props.get('size-numeric'),
+                "fr": props.get('freespace'),
+                "frn": props.get('freespace-numeric'),
+                "rs": props.get('raw-size'),
+                "rsn": props.get('raw-size-numeric')
             }
             all_components[dg_sn] = dg_full_data
     elif component == 'volumes':
-        for PROP in xml.findall("./OBJECT[@name='volume']"):
-            vol_sn = PROP.find("./PROPERTY[@name='serial-number']").text
-            vol_health_num = PROP.find("./PROPERTY[@name='health-numeric']").text
-            vol_owner_num = PROP.find("./PROPERTY[@name='owner-numeric']").text
-            vol_owner_pref_num = PROP.find("./PROPERTY[@name='preferred-owner-numeric']").text
-            vol_size_num = PROP.find("./PROPERTY[@name='size-numeric']").text
-            vol_size = PROP.find("./PROPERTY[@name='size']").text
-            vol_total_size_num = PROP.find("./PROPERTY[@name='total-size-numeric']").text
-            vol_total_size = PROP.find("./PROPERTY[@name='total-size']").text
-            vol_allocated_size_num = PROP.find("./PROPERTY[@name='allocated-size-numeric']").text
-            vol_allocated_size = PROP.find("./PROPERTY[@name='allocated-size']").text
-            			
+        for PROP in find_objects(xml, 'volume'):
+            props = get_props(PROP)
+            vol_sn = props.get('serial-number')
             vol_full_data = {
-                "h": vol_health_num,
-                "ow": vol_owner_num,
-                "owp": vol_owner_pref_num,
-                "szn": vol_size_num,
-                "sz": vol_size,
-                "tszn": vol_total_size_num,
-                "tsz": vol_total_size,
-                "asn": vol_allocated_size_num,
-                "as": vol_allocated_size
+                "h": props.get('health-numeric'),
+                "ow": props.get('owner-numeric'),
+                "owp": props.get('preferred-owner-numeric'),
+                "szn": props.get('size-numeric'),
+                "sz": props.get('size'),
+                "tszn": props.get('total-size-numeric'),
+                "tsz": props.get('total-size'),
+                "asn": props.get('allocated-size-numeric'),
+                "as": props.get('allocated-size')
             }
             all_components[vol_sn] = vol_full_data
     elif component == 'controllers':
-        for PROP in xml.findall("./OBJECT[@name='controllers']"):
+        for PROP in find_objects(xml, 'controllers'):
+            # Collecting controller and compact flash properties in one pass
+            props = {}
+            flash_props = None
+            for child in PROP:
+                if child.tag == 'PROPERTY':
+                    props[child.get('name')] = child.text
+                elif child.get('basetype') == 'compact-flash' and flash_props is None:
+                    flash_props = get_props(child)
+
             # Processing main controller properties
-            ctrl_id = PROP.find("./PROPERTY[@name='controller-id']").text
-            ctrl_sc_fw = PROP.find("./PROPERTY[@name='sc-fw']").text
-            ctrl_health_num = PROP.find("./PROPERTY[@name='health-numeric']").text
-            ctrl_status_num = PROP.find("./PROPERTY[@name='status-numeric']").text
-            ctrl_rd_status_num = PROP.find("./PROPERTY[@name='redundancy-status-numeric']").text
+            ctrl_id = props.get('controller-id')
 
             # Get controller statistics
-            url = '{strg}/api/show/{comp}/{ctrl}'.format(strg=msa_conn, comp='controller-statistics', ctrl=ctrl_id)
-
-            # Making request to API
-            stats_ret_code, stats_descr, stats_xml = query_xmlapi(url, sessionkey)
-            if stats_ret_code != '0':
-                raise SystemExit('ERROR: {} : {}'.format(stats_ret_code, stats_descr))
+            stats_xml = fetch_component(msa, 'controller-statistics/{}'.format(ctrl_id), sessionkey)
 
             # TODO: I don't know, is it good solution, but it's one more query to XML API
-            ctrl_cpu_load = stats_xml.find("./OBJECT[@name='controller-statistics']/PROPERTY[@name='cpu-load']").text
-            ctrl_iops = stats_xml.find("./OBJECT[@name='controller-statistics']/PROPERTY[@name='iops']").text
+            stats = get_props(find_objects(stats_xml, 'controller-statistics')[0])
 
             # Making full controller dict
             ctrl_full_data = {
-                "h": ctrl_health_num,
-                "s": ctrl_status_num,
-                "rs": ctrl_rd_status_num,
-                "cpu": ctrl_cpu_load,
-                "io": ctrl_iops,
-                "fw": ctrl_sc_fw
+                "h": props.get('health-numeric'),
+                "s": props.get('status-numeric'),
+                "rs": props.get('redundancy-status-numeric'),
+                "cpu": stats.get('cpu-load'),
+                "io": stats.get('iops'),
+                "fw": props.get('sc-fw')
             }
 
             # Processing advanced controller properties
-            ctrl_ext = dict()
-            ctrl_ext['fh'] = PROP.find("./OBJECT[@basetype='compact-flash']/PROPERTY[@name='health-numeric']")
-            ctrl_ext['fs'] = PROP.find("./OBJECT[@basetype='compact-flash']/PROPERTY[@name='status-numeric']")
-            for prop, value in ctrl_ext.items():
-                if value is not None:
-                    ctrl_full_data[prop] = value.text
+            if flash_props is not None:
+                ctrl_ext = dict()
+                ctrl_ext['fh'] = 'health-numeric'
+                ctrl_ext['fs'] = 'status-numeric'
+                for prop, name in ctrl_ext.items():
+                    if name in flash_props:
+                        ctrl_full_data[prop] = flash_props[name]
             all_components[ctrl_id] = ctrl_full_data
     elif component == 'enclosures':
-        for PROP in xml.findall("./OBJECT[@name='enclosures']"):
+        for PROP in find_objects(xml, 'enclosures'):
+            props = get_props(PROP)
             # Processing main enclosure properties
-            encl_id = PROP.find("./PROPERTY[@name='enclosure-id']").text
-            encl_health_num = PROP.find("./PROPERTY[@name='health-numeric']").text
-            encl_status_num = PROP.find("./PROPERTY[@name='status-numeric']").text
+            encl_id = props.get('enclosure-id')
             # Making full enclosure dict
             encl_full_data = {
-                "h": encl_health_num,
-                "s": encl_status_num
+                "h": props.get('health-numeric'),
+                "s": props.get('status-numeric')
             }
             all_components[encl_id] = encl_full_data
     elif component == 'power-supplies':
         # Getting info about all power supplies
-        for PS in xml.findall("./OBJECT[@name='power-supplies']"):
+        for PS in find_objects(xml, 'power-supplies'):
+            props = get_props(PS)
             # Processing main power supplies properties
-            ps_id = PS.find("./PROPERTY[@name='durable-id']").text
-            ps_name = PS.find("./PROPERTY[@name='name']").text
+            ps_id = props.get('durable-id')
+            ps_name = props.get('name')
             # Exclude voltage regulators
             if ps_name.lower().find('voltage regulator') == -1:
-                ps_health_num = PS.find("./PROPERTY[@name='health-numeric']").text
-                ps_status_num = PS.find("./PROPERTY[@name='status-numeric']").text
-                ps_dc12v = PS.find("./PROPERTY[@name='dc12v']").text
-                ps_dc5v = PS.find("./PROPERTY[@name='dc5v']").text
-                ps_dc33v = PS.find("./PROPERTY[@name='dc33v']").text
-                ps_dc12i = PS.find("./PROPERTY[@name='dc12i']").text
-                ps_dc5i = PS.find("./PROPERTY[@name='dc5i']").text
                 ps_full_data = {
-                    "h": ps_health_num,
-                    "s": ps_status_num,
-                    "12v": ps_dc12v,
-                    "5v": ps_dc5v,
-                    "33v": ps_dc33v,
-                    "12i": ps_dc12i,
-                    "5i": ps_dc5i
+                    "h": props.get('health-numeric'),
+                    "s": props.get('status-numeric'),
+                    "12v": props.get('dc12v'),
+                    "5v": props.get('dc5v'),
+                    "33v": props.get('dc33v'),
+                    "12i": props.get('dc12i'),
+                    "5i": props.get('dc5i')
                 }
                 # Processing advanced power supplies properties
                 ps_ext = dict()
-                ps_ext['t'] = PS.find("./PROPERTY[@name='dctemp']")
-                for prop, value in ps_ext.items():
-                    if value is not None:
-                        ps_full_data[prop] = value.text
+                ps_ext['t'] = 'dctemp'
+                for prop, name in ps_ext.items():
+                    if name in props:
+                        ps_full_data[prop] = props[name]
                 all_components[ps_id] = ps_full_data
     elif component == 'fans':
         # Getting info about all fans
-        for FAN in xml.findall("./OBJECT[@name='fan-details']"):
+        for FAN in find_objects(xml, 'fan-details'):
+            props = get_props(FAN)
             # Processing main fan properties
-            fan_id = FAN.find(".PROPERTY[@name='durable-id']").text
-            fan_health_num = FAN.find(".PROPERTY[@name='health-numeric']").text
-            fan_status_num = FAN.find(".PROPERTY[@name='status-numeric']").text
-            fan_speed = FAN.find(".PROPERTY[@name='speed']").text
+            fan_id = props.get('durable-id')
             fan_full_data = {
-                "h": fan_health_num,
-                "s": fan_status_num,
-                "sp": fan_speed
+                "h": props.get('health-numeric'),
+                "s": props.get('status-numeric'),
+                "sp": props.get('speed')
             }
             all_components[fan_id] = fan_full_data
     elif component == 'ports':
-        for FC in xml.findall("./OBJECT[@name='ports']"):
+        for FC in find_objects(xml, 'ports'):
+            # Collecting port and port details properties in one pass
+            props = {}
+            details = {}
+            for child in FC:
+                if child.tag == 'PROPERTY':
+                    props[child.get('name')] = child.text
+                elif child.get('name') == 'port-details' and not details:
+                    details = get_props(child)
+
             # Processing main ports properties
-            port_name = FC.find("./PROPERTY[@name='port']").text
-            port_health_num = FC.find("./PROPERTY[@name='health-numeric']").text
-            port_type = FC.find("./PROPERTY[@name='port-type']").text
-            port_speed = FC.find("./PROPERTY[@name='actual-speed']").text
-            port_status = FC.find("./PROPERTY[@name='status']").text
+            port_name = props.get('port')
             port_full_data = {
-                "h": port_health_num,
-                "pt": port_type,
-                "pas": port_speed,
-                "ps": port_status
+                "h": props.get('health-numeric'),
+                "pt": props.get('port-type'),
+                "pas": props.get('actual-speed'),
+                "ps": props.get('status')
             }
 
             # Processing advanced ports properties
             port_ext = dict()
-            port_ext['ps'] = FC.find("./PROPERTY[@name='status-numeric']")
-            for prop, value in port_ext.items():
-                if value is not None:
-                    port_full_data[prop] = value.text
+            port_ext['ps'] = 'status-numeric'
+            for prop, name in port_ext.items():
+                if name in props:
+                    port_full_data[prop] = props[name]
 
             # SFP Status
             # Because of before 1050/2050 API has no numeric property for sfp-status, creating mapping self
             sfp_status_map = {"Not compatible": '0', "Incorrect protocol": '1', "Not present": '2', "OK": '3'}
-            sfp_status_char = FC.find("./OBJECT[@name='port-details']/PROPERTY[@name='sfp-status']")
-            sfp_status_num = FC.find("./OBJECT[@name='port-details']/PROPERTY[@name='sfp-status-numeric']")
-            if sfp_status_num is not None:
-                port_full_data['ss'] = sfp_status_num.text
-                port_full_data['sfps'] = sfp_status_char.text
-            else:
-                if sfp_status_char is not None:
-                    port_full_data['ss'] = sfp_status_map[sfp_status_char.text]
-                    port_full_data['sfps'] = sfp_status_char.text
-                    
+            if 'sfp-status-numeric' in details:
+                port_full_data['ss'] = details['sfp-status-numeric']
+                port_full_data['sfps'] = details.get('sfp-status')
+            elif 'sfp-status' in details:
+                port_full_data['ss'] = sfp_status_map[details['sfp-status']]
+                port_full_data['sfps'] = details['sfp-status']
 
             all_components[port_name] = port_full_data
     # Transform dict keys to human readable format if '--human' argument is given
     if human:
         all_components = expand_dict(all_components)
-    return json.dumps(all_components, separators=(',', ':'), indent=pretty)
+    return all_components
+
 
+def get_batch_json(msa, components, sessionkey, lld=False, pretty=False, human=False):
+    """
+    Form JSON with data of several storage components, requested from API in parallel.
+
+    :param msa: MSA DNS name and IP address.
+    :type msa: tuple
+    :param components: Names of storage components.
+    :type components: list
+    :param sessionkey: Session key.
+    :type sessionkey: str
+    :param lld: Collect LLD data instead of full components data.
+    :type lld: bool
+    :param pretty: Print in pretty format
+    :type pretty: int
+    :param human: Expand result dict keys in human readable format
+    :type human: bool
+    :return: JSON with data of every component by component name.
+    :rtype: bytes
+    """
+
+    from concurrent.futures import ThreadPoolExecutor
+    # Requests are network bound, threads wait for the storage with GIL released
+    with ThreadPoolExecutor(max_workers=min(len(components), BATCH_MAX_WORKERS)) as executor:
+        results = executor.map(lambda comp: fetch_part(msa, comp, sessionkey, lld, human), components)
+        all_data = dict(zip(components, results))
+    return dump_json(all_data, pretty)
+
+
+def fetch_part(msa, component, sessionkey, lld=False, human=False):
+    """
+    Collect data of one storage component for batch JSON.
+
+    :param msa: MSA DNS name and IP address.
+    :type msa: tuple
+    :param component: Name of storage component.
+    :type component: str
+    :param sessionkey: Session key.
+    :type sessionkey: str
+    :param lld: Collect LLD data instead of full component data.
+    :type lld: bool
+    :param human: Expand result dict keys in human readable format
+    :type human: bool
+    :return: Dictionary with LLD data or metrics by component id.
+    :rtype: dict
+    """
+
+    if lld:
+        return {"data": get_lld_data(msa, component, sessionkey)}
+    return get_full_data(msa, component, sessionkey, human)
+
+
+def fast_parse_args(argv):
+    """
+    Parse arguments of 'lld', 'full' and 'full-batch' commands without building ArgumentParser.
 
-def expand_dict(init_dict):
+    :param argv: Command line arguments without program name.
+    :type argv: list
+    :return: Parsed arguments or None if they must be parsed by ArgumentParser (other commands, help or errors).
+    :rtype: Union[argparse.Namespace, None]
+    """
+
+    args = Namespace(api=2, username='monitor', password='!monitor', login_file=None, save_xml=None,
+                     tmp_dir=DEFAULT_TMP_DIR, ssl=None, pretty=False, human=False)
+    positional = []
+    i = 0
+    while i < len(argv):
+        arg = argv[i]
+        i += 1
+        if not arg.startswith('-'):
+            positional.append(arg)
+            continue
+        # Options after command belong to subparser
+        if positional:
+            return None
+        name, sep, value = arg.partition('=')
+        if name not in FAST_OPTIONS:
+            return None
+        dest, converter, choices = FAST_OPTIONS[name]
+        if converter is None:
+            if sep:
+                return None
+            setattr(args, dest, True)
+            continue
+        if not sep:
+            if i == len(argv) or argv[i].startswith('-'):
+                return None
+            value = argv[i]
+            i += 1
+        try:
+            value = converter(value)
+        except ValueError:
+            return None
+        if choices is not None and value not in choices:
+            return None
+        setattr(args, dest, value)
+
+    if len(positional) >= 3 and positional[0] == 'full-batch':
+        if not all(part in MSA_PARTS for part in positional[2:]):
+            return None
+        args.command, args.msa, args.parts = positional[0], positional[1], positional[2:]
+        return args
+    if len(positional) != 3 or positional[0] not in ('lld', 'full'):
+        return None
+    args.command, args.msa = positional[0], positional[1]
+    try:
+        args.part = parts_list(positional[2])
+    except ArgumentTypeError:
+        return None
+    return args
+
+
+def parts_list(value):
+    """
+    Parse comma separated list of MSA part names.
+
+    :param value: Part name or comma separated part names.
+    :type value: str
+    :return: List of part names.
+    :rtype: list
+    """
+
+    parts = value.split(',')
+    for part in parts:
+        if part not in MSA_PARTS:
+            raise ArgumentTypeError("invalid choice: '{}' (choose from {})".format(part, ', '.join(MSA_PARTS)))
+    return parts
+
+
+def expand_dict(init_dict, _get=_HUMAN_KEY_MAP.get):
     """
     Expand dict keys to full names
 
     :param init_dict: Initial dict
     :type: dict
-    :return: Dictionary with fully expanded key names
+    :return: Dictionary with fully expanded key names, keys without full name are kept as is
     :rtype: dict
     """
 
-    # Match dict for print output in human readable format
-    m = {'h': 'health', 's': 'status', 'ow': 'owner', 'owp': 'owner-preferred', 't': 'temperature',
-         'ts': 'temperature-status', 'cj': 'current-job', 'poh': 'power-on-hours', 'rs': 'redundancy-status',
-         'fw': 'firmware-version', 'sp': 'speed', 'ps': 'port-status', 'ss': 'sfp-status',
-         'fh': 'flash-health', 'fs': 'flash-status', '12v': 'power-12v', '5v': 'power-5v',
-         '33v': 'power-33v', '12i': 'power-12i', '5i': 'power-5i', 'io': 'iops', 'cpu': 'cpu-load',
-         'cjp': 'current-job-completion'
-         }
+    # _get(key, key) keeps unknown keys, map() and zip() build the dict without Python level loop
+    return {compid: dict(zip(map(_get, metrics, metrics), metrics.values())) for compid, metrics in init_dict.items()}
 
-    result_dict = {}
-    for compid, metrics in init_dict.items():
-        h_metrics = {}
-        for key in metrics.keys():
-            h_metrics[m[key]] = metrics[key]
-        result_dict[compid] = h_metrics
-    return result_dict
 
+@lru_cache(maxsize=1)
+def build_parser():
+    """
+    Build command line parser. It's used for commands, which aren't handled by fast_parse_args().
 
-if __name__ == '__main__':
-    # Current program version
-    VERSION = '0.7.4'
-    MSA_PARTS = ('disks', 'vdisks', 'controllers', 'enclosures', 'fans',
-                 'power-supplies', 'ports', 'pools', 'disk-groups', 'volumes')
+    :return: Main parser.
+    :rtype: argparse.ArgumentParser
+    """
 
     # Main parser
     main_parser = ArgumentParser(description='Zabbix script for HP MSA devices.', add_help=True)
-    main_parser.add_argument('-a', '--api', type=int, default=2, choices=(1, 2), help='MSA API version (default: 2)')
+    main_parser.add_argument('-a', '--api', type=int, default=2, choices=(1, 2),
+                             help='MSA API version (default: 2)')
     main_parser.add_argument('-u', '--username', default='monitor', type=str, help='Username to connect with')
     main_parser.add_argument('-p', '--password', default='!monitor', type=str, help='Password for the username')
-    main_parser.add_argument('-f', '--login-file', nargs=1, type=str, help='Path to the file with credentials')
-    main_parser.add_argument('-v', '--version', action='version', version=VERSION, help='Print script version and exit')
-    main_parser.add_argument('-s', '--save-xml', type=str, nargs=1, help='Save response to XML file')
-    main_parser.add_argument('-t', '--tmp-dir', type=str, nargs=1, default='/var/tmp/zbx-hpmsa/', help='Temp directory')
+    main_parser.add_argument('-f', '--login-file', type=str, help='Path to the file with credentials')
+    main_parser.add_argument('-v', '--version', action='version', version=VERSION,
+                             help='Print script version and exit')
+    main_parser.add_argument('-s', '--save-xml', type=str, help='Save response to XML file')
+    main_parser.add_argument('-t', '--tmp-dir', type=str, default=DEFAULT_TMP_DIR, help='Temp directory')
     main_parser.add_argument('--ssl', type=str, choices=('direct', 'verify'), help='Use secure connections')
-    main_parser.add_argument('--pretty', action='store_true', help='Print output in pretty format')
+    main_parser.add_argument('--pretty', action='store_true',
+                             help='Print output in pretty format (with --human or from terminal)')
     main_parser.add_argument('--human', action='store_true', help='Expose shorten response fields')
 
     # Subparsers
@@ -710,31 +1105,66 @@ if __name__ == '__main__':
     # LLD script command
     lld_parser = subparsers.add_parser('lld', help='Retrieve LLD data from MSA')
     lld_parser.add_argument('msa', type=str, help='MSA address (DNS name or IP)')
-    lld_parser.add_argument('part', type=str, help='MSA part name', choices=MSA_PARTS)
+    lld_parser.add_argument('part', type=parts_list, help='MSA part name or comma separated list of names')
 
     # FULL script command
     full_parser = subparsers.add_parser('full', help='Retrieve metrics data for a MSA component')
     full_parser.add_argument('msa', type=str, help='MSA connection address (DNS name or IP)')
-    full_parser.add_argument('part', type=str, help='MSA part name', choices=MSA_PARTS)
+    full_parser.add_argument('part', type=parts_list, help='MSA part name or comma separated list of names')
+
+    # FULL-BATCH script command
+    full_batch_parser = subparsers.add_parser('full-batch', help='Retrieve metrics data for several MSA components')
+    full_batch_parser.add_argument('msa', type=str, help='MSA connection address (DNS name or IP)')
+    full_batch_parser.add_argument('parts', nargs='+', choices=MSA_PARTS, help='MSA part names')
+
+    return main_parser
+
+
+def main():
+    """
+    Run the command given in command line arguments.
+    """
 
-    args = main_parser.parse_args()
+    # Settings read by the functions above
+    global CACHE_DB, USE_SSL, VERIFY_SSL, CRED_HASH, query_xmlapi
+
+    # Hot 'lld', 'full' and 'full-batch' commands are parsed without building ArgumentParser
+    args = fast_parse_args(sys.argv[1:])
+    if args is None:
+        args = build_parser().parse_args()
 
     API_VERSION = args.api
     TMP_DIR = args.tmp_dir
-    CACHE_DB = TMP_DIR.rstrip('/') + '/zbx-hpmsa.cache.db'
+    CACHE_DB = os.path.join(TMP_DIR, 'zbx-hpmsa.cache.db')
 
-    if args.command in ('lld', 'full'):
+    if args.command in ('lld', 'full', 'full-batch'):
         # Set some global variables
         SAVE_XML = args.save_xml
         USE_SSL = args.ssl in ('direct', 'verify')
         VERIFY_SSL = args.ssl == 'verify'
         MSA_USERNAME = args.username
         MSA_PASSWORD = args.password
-        to_pretty = 2 if args.pretty else None
+        # Parts requested more than once are fetched once
+        parts = list(dict.fromkeys(args.parts if args.command == 'full-batch' else args.part))
+        # Parts are requested in parallel and would write the same file at once
+        if SAVE_XML is not None and len(parts) > 1:
+            raise SystemExit("ERROR: '--save-xml' can be used with a single part only")
+        query_xmlapi = make_query(USE_SSL, VERIFY_SSL, API_VERSION, SAVE_XML, MSA_USERNAME)
+        # Pretty format is for humans only, output read by Zabbix is always compact
+        to_pretty = 2 if args.pretty and (args.human or sys.stderr.isatty()) else None
 
         # (IP, DNS)
-        IS_IP = all(elem.isdigit() for elem in args.msa.split('.'))
-        MSA_CONNECT = args.msa if IS_IP else gethostbyname(args.msa), args.msa
+        try:
+            # Alphabetic last label (TLD or short host name) can't be an IP, skip the parsing for it
+            if args.msa.rpartition('.')[2].isalpha():
+                raise ValueError(args.msa)
+            # IPv6 address must be in brackets in URL
+            MSA_ADDRESS = '[{}]'.format(args.msa) if ipaddress.ip_address(args.msa).version == 6 else args.msa
+            MSA_IP = MSA_ADDRESS
+        except ValueError:
+            MSA_ADDRESS = args.msa
+            MSA_IP = resolve_msa(MSA_ADDRESS)
+        MSA_CONNECT = (MSA_IP, MSA_ADDRESS)
 
         # Make login hash string
         if args.login_file is not None:
@@ -745,22 +1175,33 @@ if __name__ == '__main__':
         # Getting sessionkey
         skey = get_skey(MSA_CONNECT, CRED_HASH)
 
+        # Several parts with one login and HTTP session, JSON keyed by part name
+        if args.command == 'full-batch' or len(args.part) > 1:
+            output = get_batch_json(MSA_CONNECT, parts, skey, args.command == 'lld', to_pretty, args.human)
         # Make discovery
-        if args.command == 'lld':
-            print(make_lld(MSA_CONNECT, args.part, skey, to_pretty))
+        elif args.command == 'lld':
+            output = make_lld(MSA_CONNECT, parts[0], skey, to_pretty)
         # Getting full components data in JSON
-        elif args.command == 'full':
-            print(get_full_json(MSA_CONNECT, args.part, skey, to_pretty, args.human))
+        else:
+            output = get_full_json(MSA_CONNECT, parts[0], skey, to_pretty, args.human)
+        # JSON is already encoded, so write it as is
+        sys.stdout.buffer.write(output + b'\n')
     # Preparations tasks
     elif args.command == 'install':
         TMP_GROUP = args.group
         if args.reinstall:
             print("Removing '{}' and '{}'".format(CACHE_DB, TMP_DIR))
-            os.remove(CACHE_DB)
-            os.rmdir(TMP_DIR)
-            install_script(TMP_DIR, TMP_GROUP)
-        else:
-            install_script(TMP_DIR, TMP_GROUP)
+            try:
+                # Cache DB with SQLite WAL files
+                for db_file in (CACHE_DB, CACHE_DB + '-wal', CACHE_DB + '-shm'):
+                    if os.path.exists(db_file):
+                        os.remove(db_file)
+                # Directory is kept if there is anything else, like saved XML files
+                if os.path.isdir(TMP_DIR) and not os.listdir(TMP_DIR):
+                    os.rmdir(TMP_DIR)
+            except OSError as e:
+                raise SystemExit("ERROR: Cannot remove cache: {}".format(e))
+        install_script(TMP_DIR, TMP_GROUP)
     # Operations with cache
     elif args.command == 'cache':
         if args.show:
@@ -772,3 +1213,6 @@ if __name__ == '__main__':
             display_cache()
         exit(0)
 
+
+if __name__ == '__main__':
+    main()